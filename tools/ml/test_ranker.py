@@ -4,79 +4,75 @@ Test script for the ranker training.
 Generates sample data and tests the training pipeline.
 """
 
-import json
 import os
+import sys
 import tempfile
 from typing import Dict, List
 
 
-def create_sample_dataset(num_samples: int = 50) -> List[Dict]:
+def create_sample_dataset(num_samples: int = 50, seed: int = 0) -> List[Dict]:
     """
     Create a sample dataset for testing.
 
+    All random values are drawn up front as NumPy arrays; only building the
+    row dicts happens per sample.
+
     Args:
         num_samples: Number of samples to generate
+        seed: Seed for the random generator
 
     Returns:
         List of dataset rows
     """
-    data = []
-
-    for i in range(num_samples):
-        # Generate random features
-        import random
-
-        random.seed(i)
-
-        # Create two items with similar features
-        base_features = [random.random() for _ in range(10)]
+    import numpy as np
 
-        # Item A: slightly better
-        features_a = [f + random.uniform(-0.1, 0.1) for f in base_features]
+    rng = np.random.default_rng(seed)
+    num_features = 10
 
-        # Item B: slightly worse
-        features_b = [f + random.uniform(-0.1, 0.1) for f in base_features]
+    # Create two items around shared base features
+    base_features = rng.random((num_samples, num_features))
+    features_a = base_features + rng.uniform(-0.1, 0.1, (num_samples, num_features))
+    features_b = base_features + rng.uniform(-0.1, 0.1, (num_samples, num_features))
 
-        # Determine preference based on sum of features
-        score_a = sum(features_a)
-        score_b = sum(features_b)
+    # Determine preference based on sum of features
+    scores_a = features_a.sum(axis=1)
+    scores_b = features_b.sum(axis=1)
+    labels = np.sign(scores_a - scores_b).astype(int)
 
-        if score_a > score_b:
-            label = 1
-        elif score_b > score_a:
-            label = -1
-        else:
-            label = 0
+    # Add some noise to make it more realistic (10% flipped preferences)
+    flip = rng.random(num_samples) < 0.1
+    labels[flip] *= -1
 
-        # Add some noise to make it more realistic
-        if random.random() < 0.1:  # 10% chance of flipped preference
-            label = -label
+    complexity = rng.uniform(0, 1, (num_samples, 2))
+    relevance = rng.uniform(0, 1, (num_samples, 2))
+    similarity = rng.uniform(0.5, 1.0, num_samples)
 
-        # Create sample row
+    data = []
+    for i in range(num_samples):
         sample = {
             "item_a": {
                 "id": f"item_a_{i}",
                 "item_type": "test_item",
-                "embedding": features_a,
+                "embedding": features_a[i].tolist(),
                 "metrics": {
-                    "score": score_a,
-                    "complexity": random.uniform(0, 1),
-                    "relevance": random.uniform(0, 1),
+                    "score": float(scores_a[i]),
+                    "complexity": float(complexity[i, 0]),
+                    "relevance": float(relevance[i, 0]),
                 },
             },
             "item_b": {
                 "id": f"item_b_{i}",
                 "item_type": "test_item",
-                "embedding": features_b,
+                "embedding": features_b[i].tolist(),
                 "metrics": {
-                    "score": score_b,
-                    "complexity": random.uniform(0, 1),
-                    "relevance": random.uniform(0, 1),
+                    "score": float(scores_b[i]),
+                    "complexity": float(complexity[i, 1]),
+                    "relevance": float(relevance[i, 1]),
                 },
             },
-            "label": label,
+            "label": int(labels[i]),
             "reason_tags": ["test", "automated"],
-            "similarity": random.uniform(0.5, 1.0),
+            "similarity": float(similarity[i]),
         }
 
         data.append(sample)
@@ -86,15 +82,31 @@ def create_sample_dataset(num_samples: int = 50) -> List[Dict]:
 
 def save_dataset(data: List[Dict], filepath: str) -> None:
     """
-    Save dataset to JSONL format.
+    Save dataset to JSONL format (written with orjson), or to length-prefixed
+    MessagePack frames (the format train_ranker.py reads) if filepath ends
+    in .msgpack.
 
     Args:
         data: List of dataset rows
         filepath: Output file path
     """
-    with open(filepath, "w") as f:
+    if filepath.endswith(".msgpack"):
+        import msgspec
+
+        encoder = msgspec.msgpack.Encoder()
+        with open(filepath, "wb") as f:
+            for row in data:
+                payload = encoder.encode(row)
+                f.write(len(payload).to_bytes(4, "big"))
+                f.write(payload)
+        return
+
+    import orjson
+
+    with open(filepath, "wb", buffering=1 << 20) as f:
         for row in data:
-            f.write(json.dumps(row) + "\n")
+            f.write(orjson.dumps(row, option=orjson.OPT_SERIALIZE_NUMPY))
+            f.write(b"\n")
 
 
 def test_imports():
@@ -201,6 +213,75 @@ def test_training_script():
         return False
 
 
+def test_dict_metrics_schema():
+    """Test that dict-valued metrics map onto the fixed feature order."""
+    print("\nTesting dict metrics schema...")
+
+    import numpy as np
+
+    import train_ranker
+
+    metrics_list = [0.1, 0.2, 0.3, 0.4, 0.5, 0.6]
+    row = {
+        # Shuffled keys, one unknown key, and "completeness" missing
+        "a_metrics": {
+            "readability": 0.4,
+            "unknown_metric": 9.0,
+            "clarity": 0.1,
+            "keyword_density": 0.5,
+            "impact": 0.2,
+            "relevance": 0.3,
+        },
+        "b_metrics": dict(zip(train_ranker.FEATURE_NAMES, metrics_list)),
+        "label": 1,
+    }
+    list_row = {"a_metrics": metrics_list, "b_metrics": metrics_list, "label": 1}
+
+    dataset = train_ranker.PairwiseRankingDataset(
+        [row, list_row], metrics_dim=6, embedding_dim=4
+    )
+    assert len(dataset) == 2
+    assert dataset.feature_names == train_ranker.FEATURE_NAMES
+
+    expected = np.asarray(metrics_list, dtype=np.float32)
+    np.testing.assert_allclose(dataset.a_met[0, :5], expected[:5])
+    assert dataset.a_met[0, 5] == 0.0
+    np.testing.assert_allclose(dataset.b_met[0], expected)
+    np.testing.assert_allclose(dataset.a_met[1], expected)
+
+    print("✓ Dict metrics follow FEATURE_NAMES order with zero-filled gaps")
+    return True
+
+
+def test_quantized_export():
+    """Test that the exported scoring model quantizes to a working int8 model."""
+    print("\nTesting int8 quantization...")
+
+    from unittest import mock
+
+    import train_ranker
+
+    embedding_dim, metrics_dim = 16, 6
+    model = train_ranker.PairwiseRankerMLP(
+        embedding_dim=embedding_dim, metrics_dim=metrics_dim, hidden_dim=32
+    )
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        model_path = os.path.join(temp_dir, "ranker.onnx")
+
+        # Without onnxsim the exported graph is quantized exactly as written
+        with mock.patch.dict(sys.modules, {"onnxsim": None}):
+            train_ranker.export_onnx(model, embedding_dim, metrics_dim, model_path)
+
+        quantized_path = train_ranker.quantize_onnx(model_path)
+        assert quantized_path is not None
+        assert os.path.exists(quantized_path)
+        assert train_ranker.verify_onnx(quantized_path, embedding_dim, metrics_dim)
+
+    print("✓ Quantized model exported and verified")
+    return True
+
+
 def main():
     """Main test function."""
     print("🧪 Testing Ranker Training System")
@@ -210,6 +291,8 @@ def main():
         ("Import Test", test_imports),
         ("Dataset Generation Test", test_dataset_generation),
         ("Training Script Test", test_training_script),
+        ("Dict Metrics Test", test_dict_metrics_schema),
+        ("Quantization Test", test_quantized_export),
     ]
 
     results = []
@@ -217,7 +300,11 @@ def main():
     for test_name, test_func in tests:
         print(f"\n{test_name}:")
         print("-" * len(test_name))
-        success = test_func()
+        try:
+            success = test_func()
+        except Exception as e:
+            print(f"✗ {test_name} failed: {e}")
+            success = False
         results.append((test_name, success))
 
     print("\n" + "=" * 40)
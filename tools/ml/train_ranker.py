@@ -3,7 +3,7 @@
 Pairwise Ranker Training Script
 
 Trains a neural network for pairwise ranking using margin ranking loss.
-Input: JSONL dataset from ranker export
+Input: JSONL dataset from ranker export (or length-prefixed MessagePack, .msgpack)
 Output: ONNX model + metadata JSON
 
 Usage:
@@ -11,21 +11,26 @@ Usage:
 """
 
 import argparse
+import base64
+import copy
 import hashlib
+import inspect
 import json
 import os
 import sys
 import time
-from typing import Dict, List, Tuple, Optional
+from typing import Callable, Dict, Iterable, Iterator, List, Tuple, Optional, Union
 from datetime import datetime
 
+import msgspec
 import numpy as np
-import onnx
 import onnxruntime
+import orjson
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from torch.utils.data import DataLoader, Dataset
+from sklearn.preprocessing import StandardScaler
+from torch.utils.data import DataLoader, Dataset, SubsetRandomSampler
 from tqdm import tqdm
 
 # Set random seeds for reproducibility
@@ -41,7 +46,103 @@ DEFAULT_LEARNING_RATE = 0.001
 DEFAULT_BATCH_SIZE = 32
 DEFAULT_EPOCHS = 50
 DEFAULT_MARGIN = 0.5
+DEFAULT_PATIENCE = 6
+DEFAULT_MIN_DELTA = 1e-4
+DEFAULT_NUM_WORKERS = min(4, os.cpu_count() or 1)
 MIN_PAIRS_REQUIRED = 10
+MSGPACK_SUFFIX = ".msgpack"
+MSGPACK_FRAME_HEADER_BYTES = 4  # big-endian uint32 payload length per row
+READ_BUFFER_BYTES = 1 << 20
+ONNX_OPSET = 18
+LEGACY_ONNX_OPSET = 13
+
+# Fixed metric column order; dict-valued metrics are mapped onto it
+FEATURE_NAMES = [
+    "clarity",
+    "impact",
+    "relevance",
+    "readability",
+    "keyword_density",
+    "completeness",
+]
+
+
+class PairRow(msgspec.Struct):
+    """Schema of one exported training pair. Unknown fields are ignored."""
+
+    a_metrics: Union[List[float], Dict[str, float]] = []
+    b_metrics: Union[List[float], Dict[str, float]] = []
+    a_embedding: List[float] = []
+    b_embedding: List[float] = []
+    a_embedding_b64: str = ""
+    b_embedding_b64: str = ""
+    label: int = 0
+
+
+def row_metrics(row: Dict, key: str):
+    """Return a row's metrics as a sequence in FEATURE_NAMES order.
+
+    Metrics may be a list already in that order or a dict keyed by feature
+    name; dict keys outside the schema are ignored and missing ones read
+    as 0.0, so every row yields the same columns.
+    """
+    metrics = row.get(key, [])
+    if isinstance(metrics, dict):
+        return [metrics.get(name, 0.0) for name in FEATURE_NAMES]
+    return metrics
+
+
+def row_embedding(row: Dict, key: str):
+    """Return a row's embedding, preferring its packed `<key>_b64` form.
+
+    A base64 string of little-endian float32 bytes decodes with a single
+    copy instead of converting a list of Python floats element by element.
+    """
+    encoded = row.get(f"{key}_b64")
+    if encoded:
+        return np.frombuffer(base64.b64decode(encoded), dtype="<f4")
+    return row.get(key, [])
+
+
+def iter_rows(path: str) -> Iterator[Dict]:
+    """Yield dataset rows from JSONL, or from MessagePack frames if the path
+    ends in .msgpack (each row is a 4-byte big-endian length + payload).
+
+    Rows are decoded one at a time so callers can stream a large file
+    without holding every parsed row in memory.
+    """
+    if path.endswith(MSGPACK_SUFFIX):
+        decoder = msgspec.msgpack.Decoder(PairRow)
+        with open(path, "rb", buffering=READ_BUFFER_BYTES) as f:
+            while header := f.read(MSGPACK_FRAME_HEADER_BYTES):
+                payload = f.read(int.from_bytes(header, "big"))
+                try:
+                    yield msgspec.structs.asdict(decoder.decode(payload))
+                except msgspec.DecodeError as e:
+                    print(f"Warning: Skipping row due to error: {e}", file=sys.stderr)
+        return
+
+    with open(path, "rb", buffering=READ_BUFFER_BYTES) as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError as e:
+                print(f"Warning: Skipping row due to error: {e}", file=sys.stderr)
+
+
+def count_rows(path: str) -> int:
+    """Count rows in a dataset file without decoding them."""
+    count = 0
+    with open(path, "rb", buffering=READ_BUFFER_BYTES) as f:
+        if path.endswith(MSGPACK_SUFFIX):
+            while header := f.read(MSGPACK_FRAME_HEADER_BYTES):
+                f.seek(int.from_bytes(header, "big"), os.SEEK_CUR)
+                count += 1
+        else:
+            count = sum(1 for line in f if line.strip())
+    return count
 
 
 class PairwiseRankingDataset(Dataset):
@@ -49,79 +150,188 @@ class PairwiseRankingDataset(Dataset):
 
     def __init__(
         self,
-        data: List[Dict],
+        data: Iterable[Dict],
         metrics_dim: int = DEFAULT_METRICS_DIM,
         embedding_dim: int = DEFAULT_EMBEDDING_DIM,
+        num_rows: Optional[int] = None,
     ):
-        """Initialize dataset from JSONL rows."""
-        self.data = []
+        """Initialize dataset from JSONL rows.
+
+        Each side of a pair is packed into one contiguous float32 matrix of
+        model inputs, [embedding | metrics] per row, so samples and batches are
+        cheap slices that the model consumes without concatenating.
+        `data` may be any iterable of rows if `num_rows` bounds its length;
+        rows are written straight into the preallocated arrays as they arrive.
+        """
         self.metrics_dim = metrics_dim
         self.embedding_dim = embedding_dim
         self.feature_names = []
 
+        n = len(data) if num_rows is None else num_rows
+        features_dim = self.embedding_dim + self.metrics_dim
+        self.a_features = np.zeros((n, features_dim), dtype=np.float32)
+        self.b_features = np.zeros((n, features_dim), dtype=np.float32)
+        # Labels are -1/0/1: int8 storage, cast to float only in the loss
+        self.labels = np.zeros(n, dtype=np.int8)
+        self._set_column_views()
+
+        # Fill valid rows in place, compacting over skipped ones. Missing or
+        # mis-sized embeddings are left as zeros.
+        count = 0
         for row in data:
+            if count == n:
+                break
             try:
-                a_metrics = row.get("a_metrics", [])
-                b_metrics = row.get("b_metrics", [])
-                a_embedding = row.get("a_embedding", [])
-                b_embedding = row.get("b_embedding", [])
-                label = row.get("label", 0)
-
+                a_metrics = row_metrics(row, "a_metrics")
+                b_metrics = row_metrics(row, "b_metrics")
                 if (
                     len(a_metrics) != self.metrics_dim
                     or len(b_metrics) != self.metrics_dim
                 ):
                     continue
 
-                a_emb = (
-                    np.array(a_embedding, dtype=np.float32)
-                    if a_embedding
-                    else np.zeros(self.embedding_dim, dtype=np.float32)
-                )
-                b_emb = (
-                    np.array(b_embedding, dtype=np.float32)
-                    if b_embedding
-                    else np.zeros(self.embedding_dim, dtype=np.float32)
-                )
-
-                self.data.append(
-                    {
-                        "a_metrics": np.array(a_metrics, dtype=np.float32),
-                        "b_metrics": np.array(b_metrics, dtype=np.float32),
-                        "a_embedding": a_emb,
-                        "b_embedding": b_emb,
-                        "label": label,
-                    }
-                )
-
+                a_embedding = row_embedding(row, "a_embedding")
+                b_embedding = row_embedding(row, "b_embedding")
+                self.a_met[count] = np.asarray(a_metrics, dtype=np.float32)
+                self.b_met[count] = np.asarray(b_metrics, dtype=np.float32)
+                if len(a_embedding) == self.embedding_dim:
+                    self.a_emb[count] = np.asarray(a_embedding, dtype=np.float32)
+                else:
+                    self.a_emb[count] = 0.0
+                if len(b_embedding) == self.embedding_dim:
+                    self.b_emb[count] = np.asarray(b_embedding, dtype=np.float32)
+                else:
+                    self.b_emb[count] = 0.0
+                self.labels[count] = row.get("label", 0)
+                count += 1
             except Exception as e:
                 print(f"Warning: Skipping row due to error: {e}", file=sys.stderr)
                 continue
 
-        if self.data:
-            self.feature_names = [
-                "clarity",
-                "impact",
-                "relevance",
-                "readability",
-                "keyword_density",
-                "completeness",
-            ]
+        if count < n:
+            # Prefix slices of C-contiguous arrays stay contiguous
+            self.a_features = self.a_features[:count]
+            self.b_features = self.b_features[:count]
+            self.labels = self.labels[:count]
+            self._set_column_views()
+
+        # Shares memory with self.labels; both fetch paths index it rather
+        # than wrapping a fresh label array per sample or batch
+        self.labels_t = torch.from_numpy(self.labels)
+
+        if count:
+            self.feature_names = list(FEATURE_NAMES)
+
+    @classmethod
+    def from_file(
+        cls,
+        path: str,
+        metrics_dim: int = DEFAULT_METRICS_DIM,
+        embedding_dim: int = DEFAULT_EMBEDDING_DIM,
+        num_rows: Optional[int] = None,
+    ) -> "PairwiseRankingDataset":
+        """Build a dataset by streaming a .jsonl or .msgpack file.
+
+        A cheap counting pass sizes the arrays (skipped if `num_rows` is
+        known), then rows are parsed one at a time so peak memory is the
+        packed arrays plus a single parsed row.
+        """
+        if num_rows is None:
+            num_rows = count_rows(path)
+        return cls(iter_rows(path), metrics_dim, embedding_dim, num_rows)
+
+    def fit_normalizer(self, indices) -> StandardScaler:
+        """Standardize both feature matrices in place from the given rows.
+
+        Statistics are fitted with one partial_fit per side (no stacked
+        copy of A and B), then applied as a broadcast subtract/divide that
+        keeps the embedding/metrics column views valid.
+        """
+        idx = np.asarray(indices, dtype=np.intp)
+        scaler = StandardScaler()
+        scaler.partial_fit(self.a_features[idx])
+        scaler.partial_fit(self.b_features[idx])
+
+        mean = scaler.mean_.astype(np.float32)
+        scale = scaler.scale_.astype(np.float32)
+        for features in (self.a_features, self.b_features):
+            features -= mean
+            features /= scale
+        return scaler
+
+    def _set_column_views(self):
+        """Expose the embedding and metrics blocks of each feature matrix."""
+        self.a_emb = self.a_features[:, : self.embedding_dim]
+        self.a_met = self.a_features[:, self.embedding_dim :]
+        self.b_emb = self.b_features[:, : self.embedding_dim]
+        self.b_met = self.b_features[:, self.embedding_dim :]
 
     def __len__(self):
-        return len(self.data)
+        return len(self.labels)
 
     def __getitem__(self, idx):
-        item = self.data[idx]
         return {
-            "a_metrics": torch.tensor(item["a_metrics"]),
-            "b_metrics": torch.tensor(item["b_metrics"]),
-            "a_embedding": torch.tensor(item["a_embedding"]),
-            "b_embedding": torch.tensor(item["b_embedding"]),
-            "label": torch.tensor(item["label"], dtype=torch.float32),
+            "a_features": torch.from_numpy(self.a_features[idx]),
+            "b_features": torch.from_numpy(self.b_features[idx]),
+            "label": self.labels_t[idx],
+        }
+
+    def __getitems__(self, indices):
+        """Fetch a whole batch with one gather per array.
+
+        DataLoader calls this instead of __getitem__ when present, so batches
+        are built without per-sample tensors or default_collate stacking.
+        """
+        # Convert the sampler's index list once and reuse it for every gather
+        idx = np.asarray(indices, dtype=np.intp)
+        return {
+            "a_features": torch.from_numpy(self.a_features[idx]),
+            "b_features": torch.from_numpy(self.b_features[idx]),
+            "label": self.labels_t[torch.from_numpy(idx)],
         }
 
 
+def collate_batch(batch: Dict[str, torch.Tensor]) -> Dict[str, torch.Tensor]:
+    """Pass-through collate for batches already assembled by __getitems__."""
+    return batch
+
+
+class ShuffledBatches:
+    """In-process, shuffled batch iterator over a subset of a dataset.
+
+    Stands in for a DataLoader when there are no workers: each epoch draws
+    one torch.randperm over the subset and gathers every batch with a
+    single __getitems__ call, skipping the sampler/fetcher machinery.
+    """
+
+    def __init__(
+        self,
+        dataset: PairwiseRankingDataset,
+        indices: List[int],
+        batch_size: int,
+        drop_last: bool = False,
+        pin_memory: bool = False,
+    ):
+        self.dataset = dataset
+        self.indices = np.asarray(indices, dtype=np.intp)
+        self.batch_size = batch_size
+        self.drop_last = drop_last
+        self.pin_memory = pin_memory
+
+    def __len__(self) -> int:
+        if self.drop_last:
+            return len(self.indices) // self.batch_size
+        return -(-len(self.indices) // self.batch_size)
+
+    def __iter__(self) -> Iterator[Dict[str, torch.Tensor]]:
+        perm = self.indices[torch.randperm(len(self.indices)).numpy()]
+        for start in range(0, len(self) * self.batch_size, self.batch_size):
+            batch = self.dataset.__getitems__(perm[start : start + self.batch_size])
+            if self.pin_memory:
+                batch = {name: tensor.pin_memory() for name, tensor in batch.items()}
+            yield batch
+
+
 class PairwiseRankerMLP(nn.Module):
     """Neural network for pairwise ranking."""
 
@@ -150,188 +360,405 @@ class PairwiseRankerMLP(nn.Module):
         self._init_weights()
 
     def _init_weights(self):
-        for m in self.modules():
+        def init_linear(m: nn.Module) -> None:
             if isinstance(m, nn.Linear):
                 nn.init.xavier_uniform_(m.weight)
                 if m.bias is not None:
                     nn.init.zeros_(m.bias)
 
-    def forward(
-        self,
-        a_embeddings: torch.Tensor,
-        a_metrics: torch.Tensor,
-        b_embeddings: torch.Tensor,
-        b_metrics: torch.Tensor,
-    ) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
-        """Forward pass returning scores for both items."""
-        # Combine embeddings and metrics
-        a_features = torch.cat([a_embeddings, a_metrics], dim=-1)
-        b_features = torch.cat([b_embeddings, b_metrics], dim=-1)
+        with torch.no_grad():
+            self.apply(init_linear)
 
-        # Encode features
-        a_encoded = self.feature_encoder(a_features)
-        b_encoded = self.feature_encoder(b_features)
+    def forward(self, features: torch.Tensor) -> torch.Tensor:
+        """Score [embedding | metrics] rows, returning one score per row.
 
-        # Get scores
-        a_score = self.score_head(a_encoded).squeeze(-1)
-        b_score = self.score_head(b_encoded).squeeze(-1)
+        Serving ranks candidates by score, so this single-item pass is what
+        gets exported; pairs are compared by subtracting two scores.
+        """
+        return self.score_head(self.feature_encoder(features)).squeeze(-1)
 
-        return a_score, b_score, a_score - b_score
+    def forward_diff(
+        self, a_features: torch.Tensor, b_features: torch.Tensor
+    ) -> torch.Tensor:
+        """Training forward pass returning only score(A) - score(B)."""
+        a_score, b_score = self.score_features(a_features, b_features)
+        return a_score - b_score
+
+    def forward_loss(
+        self,
+        a_features: torch.Tensor,
+        b_features: torch.Tensor,
+        labels: torch.Tensor,
+        margin: float = DEFAULT_MARGIN,
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Training step forward: (margin ranking loss, score differences).
+
+        Keeping the loss in the same function as the scoring lets
+        torch.compile fuse it into the final layer's epilogue.
+        """
+        diff = self.forward_diff(a_features, b_features)
+        return margin_ranking_loss(diff, labels, margin), diff
+
+    def score_features(
+        self, a_features: torch.Tensor, b_features: torch.Tensor
+    ) -> Tuple[torch.Tensor, torch.Tensor]:
+        """Score pre-packed [embedding | metrics] rows for both items."""
+        # Score both sides in one pass over a (2B, D) batch
+        scores = self(torch.cat([a_features, b_features], dim=0))
+        batch_size = a_features.shape[0]
+        return scores[:batch_size], scores[batch_size:]
 
 
 def margin_ranking_loss(
-    a_scores: torch.Tensor,
-    b_scores: torch.Tensor,
+    diff: torch.Tensor,
     labels: torch.Tensor,
     margin: float = DEFAULT_MARGIN,
 ) -> torch.Tensor:
-    """Margin ranking loss."""
-    loss = nn.functional.relu(margin - labels * (a_scores - b_scores))
+    """Margin ranking loss on score differences (score(A) - score(B))."""
+    loss = nn.functional.relu(margin - labels.float() * diff)
     return loss.mean()
 
 
-def compute_accuracy(
-    a_scores: torch.Tensor, b_scores: torch.Tensor, labels: torch.Tensor
-) -> float:
-    """Compute pairwise accuracy."""
-    predictions = (a_scores > b_scores).float()
-    correct = ((predictions == (labels > 0)).float()).mean()
-    return correct.item()
+def compute_accuracy(diff: torch.Tensor, labels: torch.Tensor) -> torch.Tensor:
+    """Compute pairwise accuracy as a 0-d tensor (no host sync)."""
+    # Compare the boolean masks directly; one float cast for the mean
+    return ((diff > 0) == (labels > 0)).float().mean()
+
+
+def compile_train_step(
+    model: PairwiseRankerMLP, device: torch.device
+) -> Callable[..., Tuple[torch.Tensor, torch.Tensor]]:
+    """torch.compile `model.forward_loss`, falling back to eager on failure.
+
+    Inductor compiles lazily on the first call, so a missing C++ toolchain
+    or Triton only surfaces there; the step then warns and keeps training
+    eagerly instead of aborting the run.
+    """
+    # Training batches all have the same shape, so compile statically.
+    # CUDA graphs (reduce-overhead) only pay off on GPU, where this small
+    # MLP is bound by kernel launches; on CPU plain Inductor fusion is used.
+    compiled = torch.compile(
+        model.forward_loss,
+        backend="inductor",
+        mode="reduce-overhead" if device.type == "cuda" else "default",
+        dynamic=False,
+    )
+    from torch._dynamo.exc import BackendCompilerFailed
+
+    step = compiled
+
+    def train_step(*args):
+        nonlocal step
+        try:
+            return step(*args)
+        except BackendCompilerFailed as e:
+            print(
+                f"Warning: torch.compile failed, training eagerly: {e}",
+                file=sys.stderr,
+            )
+            step = model.forward_loss
+            return step(*args)
+
+    return train_step
 
 
 def train_epoch(
     model: nn.Module,
-    dataloader: DataLoader,
+    train_step: Callable[..., Tuple[torch.Tensor, torch.Tensor]],
+    dataloader: Union[DataLoader, ShuffledBatches],
     optimizer: optim.Optimizer,
     device: torch.device,
     margin: float = DEFAULT_MARGIN,
 ) -> Tuple[float, float]:
-    """Train for one epoch."""
-    model.train()
-    total_loss = 0.0
-    total_acc = 0.0
-
-    for batch in tqdm(dataloader, desc="Training", leave=False):
-        a_metrics = batch["a_metrics"].to(device)
-        b_metrics = batch["b_metrics"].to(device)
-        a_embeddings = batch["a_embedding"].to(device)
-        b_embeddings = batch["b_embedding"].to(device)
-        labels = batch["label"].to(device)
+    """Train for one epoch.
 
-        optimizer.zero_grad()
-
-        a_scores, b_scores, diff = model(
-            a_embeddings, a_metrics, b_embeddings, b_metrics
-        )
+    `train_step` is `model.forward_loss` or a compiled wrapper around it.
+    """
+    model.train()
+    # Accumulate on device so the loop only syncs with the host once
+    total_loss = torch.zeros((), device=device)
+    total_acc = torch.zeros((), device=device)
+
+    for batch in dataloader:
+        a_features = batch["a_features"].to(device, non_blocking=True)
+        b_features = batch["b_features"].to(device, non_blocking=True)
+        labels = batch["label"].to(device, non_blocking=True)
+
+        optimizer.zero_grad(set_to_none=True)
+
+        # BF16 matmuls on CUDA; parameters and optimizer state stay FP32, and
+        # BF16's exponent range means no GradScaler is needed
+        with torch.autocast(
+            device_type=device.type,
+            dtype=torch.bfloat16,
+            enabled=device.type == "cuda",
+        ):
+            loss, diff = train_step(a_features, b_features, labels, margin)
 
-        loss = margin_ranking_loss(a_scores, b_scores, labels, margin)
         loss.backward()
 
         torch.nn.utils.clip_grad_norm_(model.parameters(), max_norm=1.0)
         optimizer.step()
 
-        total_loss += loss.item()
-        total_acc += compute_accuracy(a_scores, b_scores, labels)
+        total_loss += loss.detach()
+        total_acc += compute_accuracy(diff, labels)
 
-    return total_loss / len(dataloader), total_acc / len(dataloader)
+    return (
+        total_loss.item() / len(dataloader),
+        total_acc.item() / len(dataloader),
+    )
 
 
 def evaluate(
-    model: nn.Module, dataloader: DataLoader, device: torch.device
+    model: nn.Module,
+    batch: Dict[str, torch.Tensor],
+    collect_predictions: bool = False,
 ) -> Tuple[float, float, List[Dict]]:
-    """Evaluate model on validation set."""
+    """Evaluate model on a whole validation set in one forward pass.
+
+    `batch` holds every validation pair (see PairwiseRankingDataset
+    .__getitems__), already on the model's device. Predictions, if
+    requested, are converted to Python with one .tolist() per tensor.
+    """
+    labels = batch["label"]
+    if labels.numel() == 0:
+        return float("inf"), 0.0, []
+
+    device = labels.device
     model.eval()
-    total_loss = 0.0
-    total_acc = 0.0
-    predictions = []
+    with torch.inference_mode():
+        # Same BF16 autocast as training; scores are cast back to FP32 so
+        # the reported metrics keep full precision
+        with torch.autocast(
+            device_type=device.type,
+            dtype=torch.bfloat16,
+            enabled=device.type == "cuda",
+        ):
+            a_scores, b_scores = model.score_features(
+                batch["a_features"], batch["b_features"]
+            )
+        a_scores = a_scores.float()
+        b_scores = b_scores.float()
+        diff = a_scores - b_scores
+        loss = margin_ranking_loss(diff, labels)
+        accuracy = compute_accuracy(diff, labels)
 
-    with torch.no_grad():
-        for batch in tqdm(dataloader, desc="Evaluating", leave=False):
-            a_metrics = batch["a_metrics"].to(device)
-            b_metrics = batch["b_metrics"].to(device)
-            a_embeddings = batch["a_embedding"].to(device)
-            b_embeddings = batch["b_embedding"].to(device)
-            labels = batch["label"].to(device)
-
-            a_scores, b_scores, diff = model(
-                a_embeddings, a_metrics, b_embeddings, b_metrics
+    predictions = []
+    if collect_predictions:
+        predictions = [
+            {"a_score": a, "b_score": b, "label": label, "predicted": predicted}
+            for a, b, label, predicted in zip(
+                a_scores.tolist(),
+                b_scores.tolist(),
+                labels.tolist(),
+                (diff > 0).tolist(),
             )
+        ]
 
-            loss = margin_ranking_loss(a_scores, b_scores, labels)
+    return loss.item(), accuracy.item(), predictions
 
-            total_loss += loss.item()
-            total_acc += compute_accuracy(a_scores, b_scores, labels)
 
-            for i in range(a_scores.shape[0]):
-                predictions.append(
-                    {
-                        "a_score": a_scores[i].item(),
-                        "b_score": b_scores[i].item(),
-                        "label": labels[i].item(),
-                        "predicted": (a_scores[i] > b_scores[i]).item(),
-                    }
-                )
+def fold_input_scaling(
+    model: PairwiseRankerMLP, mean: np.ndarray, scale: np.ndarray
+) -> PairwiseRankerMLP:
+    """Return a copy of `model` that takes unnormalized features.
 
-    return total_loss / len(dataloader), total_acc / len(dataloader), predictions
+    Standardization (x - mean) / scale is folded into the first Linear
+    layer, so exported graphs keep accepting raw inputs.
+    """
+    folded = copy.deepcopy(model)
+    first = folded.feature_encoder[0]
+    weight, bias = first.weight, first.bias
+    with torch.no_grad():
+        scale_t = torch.as_tensor(scale, dtype=weight.dtype, device=weight.device)
+        mean_t = torch.as_tensor(mean, dtype=weight.dtype, device=weight.device)
+        weight.div_(scale_t)
+        bias.sub_(weight @ mean_t)
+    return folded
+
+
+def hash_file(path: str, chunk_size: int = 1 << 20) -> str:
+    """SHA-256 of a file, read in fixed-size chunks to bound memory use."""
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            hasher.update(chunk)
+    return hasher.hexdigest()
 
 
 def export_onnx(
-    model: nn.Module, embedding_dim: int, metrics_dim: int, output_path: str
-) -> None:
-    """Export model to ONNX format."""
+    model: PairwiseRankerMLP,
+    embedding_dim: int,
+    metrics_dim: int,
+    output_path: str,
+    dynamic: bool = True,
+) -> int:
+    """Export the model's single-item scorer (its forward) to ONNX format.
+
+    The graph scores single items: input [batch, embedding_dim + metrics_dim]
+    named "input", output [batch] scores named "output". Pairs are compared
+    by subtracting two scores in the caller. With dynamic=False every shape
+    is fixed to a single item (batch_size=1), letting ONNX Runtime select
+    shape-specialized kernels at load time.
+
+    Returns the ONNX opset version of the written graph.
+    """
     model.eval()
 
-    # Create sample inputs
-    batch_size = 1
-    dummy_a_emb = torch.randn(batch_size, embedding_dim)
-    dummy_a_met = torch.randn(batch_size, metrics_dim)
-    dummy_b_emb = torch.randn(batch_size, embedding_dim)
-    dummy_b_met = torch.randn(batch_size, metrics_dim)
-
-    # Create input names
-    input_names = ["a_embedding", "a_metrics", "b_embedding", "b_metrics"]
-    output_names = ["a_score", "b_score", "difference"]
-
-    # Export
-    torch.onnx.export(
-        model,
-        (dummy_a_emb, dummy_a_met, dummy_b_emb, dummy_b_met),
-        output_path,
-        input_names=input_names,
-        output_names=output_names,
-        opset_version=13,
-        dynamic_axes={
-            "a_embedding": {0: "batch_size"},
-            "a_metrics": {0: "batch_size"},
-            "b_embedding": {0: "batch_size"},
-            "b_metrics": {0: "batch_size"},
-            "a_score": {0: "batch_size"},
-            "b_score": {0: "batch_size"},
-            "difference": {0: "batch_size"},
-        },
+    # Create a sample input on the same device as the model. A dynamic batch
+    # is traced with 2 rows so it is not specialized to size 1.
+    batch_size = 2 if dynamic else 1
+    device = next(model.parameters()).device
+    dummy_input = torch.randn(batch_size, embedding_dim + metrics_dim, device=device)
+
+    input_names = ["input"]
+    output_names = ["output"]
+
+    # Export from the torch.export (FX) graph; Dropout is absent in eval
+    # mode and the weights are embedded instead of written to a sidecar.
+    # torch.export only exists from torch 2.1, and the dynamo flag from 2.5.
+    has_dynamo_flag = (
+        hasattr(torch, "export")
+        and "dynamo" in inspect.signature(torch.onnx.export).parameters
     )
+    opset = None
+    # Newer releases default the flag to True, so the fallback opts out
+    legacy_kwargs = {"dynamo": False} if has_dynamo_flag else {}
+    if has_dynamo_flag:
+        dynamic_shapes = None
+        if dynamic:
+            dynamic_shapes = ({0: torch.export.Dim("batch_size")},)
+        try:
+            torch.onnx.export(
+                model,
+                (dummy_input,),
+                output_path,
+                input_names=input_names,
+                output_names=output_names,
+                opset_version=ONNX_OPSET,
+                dynamo=True,
+                external_data=False,
+                dynamic_shapes=dynamic_shapes,
+            )
+            opset = ONNX_OPSET
+        except ImportError as e:
+            # onnxscript is not installed
+            print(
+                f"Warning: dynamo ONNX export unavailable ({e}), "
+                "falling back to the TorchScript exporter",
+                file=sys.stderr,
+            )
+
+    if opset is None:
+        # TorchScript-based exporter
+        dynamic_axes = None
+        if dynamic:
+            dynamic_axes = {
+                name: {0: "batch_size"} for name in input_names + output_names
+            }
+        torch.onnx.export(
+            model,
+            (dummy_input,),
+            output_path,
+            input_names=input_names,
+            output_names=output_names,
+            opset_version=LEGACY_ONNX_OPSET,
+            dynamic_axes=dynamic_axes,
+            # Trace in eval mode so Dropout is dropped from the graph, and
+            # fold constant subgraphs at export time
+            training=torch.onnx.TrainingMode.EVAL,
+            do_constant_folding=True,
+            **legacy_kwargs,
+        )
+        opset = LEGACY_ONNX_OPSET
+
+    # The dynamo exporter annotates shapes itself; the TorchScript one
+    # needs an explicit inference pass
+    simplify_onnx(output_path, infer_shapes=opset == LEGACY_ONNX_OPSET)
 
     print(f"  ONNX model saved to: {output_path}")
+    return opset
+
+
+def simplify_onnx(model_path: str, infer_shapes: bool = False) -> None:
+    """Rewrite the model in place: run ONNX shape inference if requested,
+    then constant-fold and simplify it if onnxsim is installed.
+
+    onnx is imported here rather than at module level, which only defers
+    loading it to export time: the dynamo exporter and quantize_onnx
+    import it as well.
+    """
+    try:
+        import onnxsim
+    except ImportError:
+        onnxsim = None
+    if onnxsim is None and not infer_shapes:
+        return
+
+    import onnx
+
+    model = onnx.load(model_path)
+    if infer_shapes:
+        model = onnx.shape_inference.infer_shapes(model)
+
+    if onnxsim is not None:
+        simplified, ok = onnxsim.simplify(model)
+        if ok:
+            model = simplified
+
+    onnx.save(model, model_path)
+
+
+def check_onnx(model_path: str) -> bool:
+    """Validate an exported model against the ONNX spec with onnx.checker."""
+    try:
+        import onnx
+
+        onnx.checker.check_model(model_path, full_check=True)
+        print(f"  ONNX checker passed: {model_path}")
+        return True
+
+    except Exception as e:
+        print(f"  ONNX checker failed: {e}", file=sys.stderr)
+        return False
+
+
+def create_onnx_session(model_path: str) -> onnxruntime.InferenceSession:
+    """Create an ONNX Runtime session tuned for low-latency pair scoring.
+
+    Full graph optimization fuses the Gemm/Relu chain; sequential execution
+    with half the cores for intra-op parallelism suits single-pair calls.
+    CUDA is used only if this onnxruntime build provides it.
+    """
+    options = onnxruntime.SessionOptions()
+    options.graph_optimization_level = (
+        onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+    )
+    options.execution_mode = onnxruntime.ExecutionMode.ORT_SEQUENTIAL
+    options.intra_op_num_threads = max(1, (os.cpu_count() or 1) // 2)
+    options.enable_mem_pattern = True
+
+    providers = ["CPUExecutionProvider"]
+    if "CUDAExecutionProvider" in onnxruntime.get_available_providers():
+        providers.insert(0, "CUDAExecutionProvider")
+
+    return onnxruntime.InferenceSession(
+        model_path, sess_options=options, providers=providers
+    )
 
 
 def verify_onnx(model_path: str, embedding_dim: int, metrics_dim: int) -> bool:
     """Verify ONNX model can be loaded and run."""
     try:
-        session = onnxruntime.InferenceSession(model_path)
+        session = create_onnx_session(model_path)
 
-        # Create test inputs
-        a_emb = np.random.randn(1, embedding_dim).astype(np.float32)
-        a_met = np.random.randn(1, metrics_dim).astype(np.float32)
-        b_emb = np.random.randn(1, embedding_dim).astype(np.float32)
-        b_met = np.random.randn(1, metrics_dim).astype(np.float32)
+        # Create a test input: one [embedding | metrics] row
+        features = np.random.randn(1, embedding_dim + metrics_dim).astype(
+            np.float32
+        )
 
         # Run inference
-        inputs = {
-            "a_embedding": a_emb,
-            "a_metrics": a_met,
-            "b_embedding": b_emb,
-            "b_metrics": b_met,
-        }
+        inputs = {"input": features}
 
         outputs = session.run(None, inputs)
 
@@ -343,9 +770,51 @@ def verify_onnx(model_path: str, embedding_dim: int, metrics_dim: int) -> bool:
         return False
 
 
+def quantize_onnx(model_path: str) -> Optional[str]:
+    """Write a dynamically int8-quantized copy of an ONNX model.
+
+    Returns the quantized model path, or None if the quantization tooling
+    (onnx / onnxruntime.quantization) is not installed. Errors raised while
+    quantizing propagate to the caller.
+    """
+    try:
+        import onnx
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+    except ImportError as e:
+        print(f"  Skipping ONNX quantization: {e}", file=sys.stderr)
+        return None
+
+    # The dynamo exporter records value_info for its initializers, which
+    # quantize_dynamic's shape inference rejects once it rewrites them
+    model = onnx.load(model_path)
+    initializer_names = {init.name for init in model.graph.initializer}
+    value_info = [
+        info for info in model.graph.value_info if info.name not in initializer_names
+    ]
+    del model.graph.value_info[:]
+    model.graph.value_info.extend(value_info)
+
+    # Older onnxruntime releases only accept a model path, so quantize from
+    # a stripped copy on disk rather than the in-memory proto
+    base_path = os.path.splitext(model_path)[0]
+    stripped_path = base_path + ".prequant.onnx"
+    quantized_path = base_path + ".int8.onnx"
+    onnx.save(model, stripped_path)
+    try:
+        quantize_dynamic(stripped_path, quantized_path, weight_type=QuantType.QInt8)
+    finally:
+        os.remove(stripped_path)
+
+    size_kb = os.path.getsize(quantized_path) / 1024
+    print(f"  Quantized model saved to: {quantized_path} ({size_kb:.1f} KB)")
+    return quantized_path
+
+
 def main():
     parser = argparse.ArgumentParser(description="Train pairwise ranker model")
-    parser.add_argument("--input", "-i", required=True, help="Input JSONL dataset path")
+    parser.add_argument(
+        "--input", "-i", required=True, help="Input dataset path (.jsonl or .msgpack)"
+    )
     parser.add_argument(
         "--output", "-o", required=True, help="Output directory for model"
     )
@@ -373,6 +842,18 @@ def main():
         default=DEFAULT_MARGIN,
         help="Margin for ranking loss",
     )
+    parser.add_argument(
+        "--patience",
+        type=int,
+        default=DEFAULT_PATIENCE,
+        help="Stop after this many epochs without loss improvement (0 disables)",
+    )
+    parser.add_argument(
+        "--min-delta",
+        type=float,
+        default=DEFAULT_MIN_DELTA,
+        help="Minimum loss decrease that counts as an improvement",
+    )
     parser.add_argument(
         "--embedding-dim",
         type=int,
@@ -380,7 +861,10 @@ def main():
         help="Embedding dimension",
     )
     parser.add_argument(
-        "--metrics-dim", type=int, default=DEFAULT_METRICS_DIM, help="Metrics dimension"
+        "--metrics-dim",
+        type=int,
+        default=DEFAULT_METRICS_DIM,
+        help="Metrics dimension (must equal the number of feature names)",
     )
     parser.add_argument(
         "--hidden-dim",
@@ -392,6 +876,29 @@ def main():
         "--val-split", type=float, default=0.2, help="Validation split ratio"
     )
     parser.add_argument("--seed", type=int, default=42, help="Random seed")
+    parser.add_argument(
+        "--num-workers",
+        type=int,
+        default=DEFAULT_NUM_WORKERS,
+        help="DataLoader worker processes (0 loads batches in the main process)",
+    )
+    parser.add_argument(
+        "--no-compile",
+        dest="compile",
+        action="store_false",
+        help="Train the eager model instead of a torch.compile'd one",
+    )
+    parser.add_argument(
+        "--no-normalize",
+        dest="normalize",
+        action="store_false",
+        help="Train on raw features instead of standardized ones",
+    )
+    parser.add_argument(
+        "--validate-onnx",
+        action="store_true",
+        help="Also run onnx.checker on the exported models",
+    )
 
     args = parser.parse_args()
 
@@ -403,48 +910,93 @@ def main():
     np.random.seed(args.seed)
     torch.manual_seed(args.seed)
 
+    # Use every core for intra-op GEMMs, and let float32 matmuls use
+    # reduced-precision fast paths (TF32 on CUDA, oneDNN on CPU)
+    torch.set_num_threads(os.cpu_count() or 1)
+    torch.set_float32_matmul_precision("high")
+
+    # Dict-valued metrics are mapped onto FEATURE_NAMES and serving builds
+    # the metrics vector from featureNames, so the width is fixed
+    if args.metrics_dim != len(FEATURE_NAMES):
+        print(
+            f"Error: --metrics-dim must be {len(FEATURE_NAMES)} "
+            f"({', '.join(FEATURE_NAMES)}), got {args.metrics_dim}",
+            file=sys.stderr,
+        )
+        sys.exit(1)
+
     # Load dataset
     print(f"\n📂 Loading dataset from: {args.input}")
     if not os.path.exists(args.input):
         print(f"Error: Input file not found: {args.input}", file=sys.stderr)
         sys.exit(1)
 
-    data = []
-    with open(args.input, "r") as f:
-        for line in f:
-            if line.strip():
-                data.append(json.loads(line))
-
-    print(f"  Loaded {len(data)} rows")
+    num_rows = count_rows(args.input)
+    print(f"  Loaded {num_rows} rows")
 
-    if len(data) < MIN_PAIRS_REQUIRED:
+    if num_rows < MIN_PAIRS_REQUIRED:
         print(
-            f"Error: Need at least {MIN_PAIRS_REQUIRED} pairs, got {len(data)}",
+            f"Error: Need at least {MIN_PAIRS_REQUIRED} pairs, got {num_rows}",
             file=sys.stderr,
         )
         sys.exit(1)
 
-    # Create dataset
-    dataset = PairwiseRankingDataset(data, args.metrics_dim)
+    # Create dataset, streaming rows straight into the packed arrays
+    dataset = PairwiseRankingDataset.from_file(
+        args.input, args.metrics_dim, args.embedding_dim, num_rows
+    )
     print(f"  Valid pairs: {len(dataset)}")
     print(f"  Metrics features: {dataset.feature_names}")
 
-    # Split train/val
+    # Split train/val as index arrays over the full dataset, so each batch
+    # is one gather from the packed arrays with no Subset indirection
     val_size = int(len(dataset) * args.val_split)
-    train_size = len(dataset) - val_size
-    train_dataset, val_dataset = torch.utils.data.random_split(
-        dataset,
-        [train_size, val_size],
-        generator=torch.Generator().manual_seed(args.seed),
-    )
-
-    train_loader = DataLoader(train_dataset, batch_size=args.batch_size, shuffle=True)
-    val_loader = DataLoader(val_dataset, batch_size=args.batch_size, shuffle=False)
+    shuffled_idx = np.random.default_rng(args.seed).permutation(len(dataset))
+    train_idx = shuffled_idx[val_size:].tolist()
+    val_idx = np.sort(shuffled_idx[:val_size]).tolist()
 
-    print(f"  Train size: {len(train_dataset)}, Val size: {len(val_dataset)}")
+    # Standardize features with training-split statistics
+    scaler = None
+    if args.normalize:
+        scaler = dataset.fit_normalizer(train_idx)
 
     # Setup device
-    device = torch.device("cpu")
+    device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
+
+    # Pinned host batches let non_blocking copies overlap with compute, and
+    # persistent workers keep batch assembly off the training thread.
+    pin_memory = device.type == "cuda"
+    # Keep every step the same shape (no recompiles or CUDA graph
+    # re-captures for a ragged tail), unless that would drop every batch
+    drop_last = len(train_idx) >= args.batch_size
+
+    if args.num_workers > 0:
+        train_loader = DataLoader(
+            dataset,
+            sampler=SubsetRandomSampler(train_idx),
+            batch_size=args.batch_size,
+            collate_fn=collate_batch,
+            pin_memory=pin_memory,
+            num_workers=args.num_workers,
+            drop_last=drop_last,
+            persistent_workers=True,
+            prefetch_factor=2,
+        )
+    else:
+        # Without workers a DataLoader only adds per-index sampler overhead
+        train_loader = ShuffledBatches(
+            dataset, train_idx, args.batch_size, drop_last, pin_memory
+        )
+
+    # The validation set is scored as a single batch: gather it once and
+    # keep it on the device for every epoch
+    val_batch = {
+        name: tensor.to(device)
+        for name, tensor in dataset.__getitems__(val_idx).items()
+    }
+
+    print(f"  Train size: {len(train_idx)}, Val size: {len(val_idx)}")
+
     print(f"\n🖥️  Device: {device}")
 
     # Initialize model
@@ -458,69 +1010,197 @@ def main():
     num_params = sum(p.numel() for p in model.parameters())
     print(f"  Parameters: {num_params:,}")
 
+    # Compile the training forward pass with its loss; the model exported to
+    # ONNX stays eager. The compiled callable is kept out of the module so
+    # copies of it (see fold_input_scaling) don't carry a compiled bound
+    # method.
+    train_step = model.forward_loss
+    if args.compile and hasattr(torch, "compile"):
+        try:
+            train_step = compile_train_step(model, device)
+        except Exception as e:
+            print(
+                f"Warning: torch.compile unavailable, training eagerly: {e}",
+                file=sys.stderr,
+            )
+
     # Optimizer
+    # Fused AdamW (torch >= 2.0) updates every parameter in a single CUDA
+    # kernel; older releases and CPU keep the default implementation
+    optimizer_kwargs = {}
+    if device.type == "cuda" and hasattr(torch, "compile"):
+        optimizer_kwargs["fused"] = True
     optimizer = optim.AdamW(
-        model.parameters(), lr=args.learning_rate, weight_decay=0.01
+        model.parameters(),
+        lr=args.learning_rate,
+        weight_decay=0.01,
+        **optimizer_kwargs,
+    )
+    # Halve the learning rate when the loss plateaus, giving it half of
+    # early stopping's patience so at least one reduction happens first
+    lr_patience = max(1, (args.patience or DEFAULT_PATIENCE) // 2)
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(
+        optimizer, mode="min", factor=0.5, patience=lr_patience
     )
-    scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=args.epochs)
 
     # Training loop
-    print(f"\n🏃 Starting training for {args.epochs} epochs...")
+    print(f"\n🏃 Starting training for up to {args.epochs} epochs...")
     best_val_acc = 0.0
     best_epoch = 0
-
-    for epoch in range(args.epochs):
+    train_loss = float("inf")
+    train_acc = 0.0
+    best_loss = float("inf")
+    best_loss_epoch = 0
+    best_state = None
+    epochs_without_improvement = 0
+    epochs_run = 0
+
+    # One progress update per epoch; a per-batch bar costs a terminal write
+    # per step, which is significant next to a step of this small model
+    progress = tqdm(range(args.epochs), desc="Training", leave=False)
+    for epoch in progress:
         train_loss, train_acc = train_epoch(
-            model, train_loader, optimizer, device, args.margin
+            model, train_step, train_loader, optimizer, device, args.margin
         )
-        val_loss, val_acc, _ = evaluate(model, val_loader, device)
-        scheduler.step()
+        val_loss, val_acc, _ = evaluate(model, val_batch)
+        epochs_run = epoch + 1
+
+        # Monitor validation loss, or training loss with no validation split
+        monitored_loss = val_loss if val_idx else train_loss
+        scheduler.step(monitored_loss)
 
         if val_acc > best_val_acc:
             best_val_acc = val_acc
             best_epoch = epoch + 1
 
-        if (epoch + 1) % 10 == 0 or epoch == 0:
-            print(
+        if monitored_loss < best_loss - args.min_delta:
+            best_loss = monitored_loss
+            best_loss_epoch = epoch + 1
+            best_state = copy.deepcopy(model.state_dict())
+            best_train_loss, best_train_acc = train_loss, train_acc
+            epochs_without_improvement = 0
+        else:
+            epochs_without_improvement += 1
+        stop_early = 0 < args.patience <= epochs_without_improvement
+
+        progress.set_postfix(
+            train_loss=f"{train_loss:.4f}", val_acc=f"{val_acc:.4f}", refresh=False
+        )
+        if (epoch + 1) % 10 == 0 or epoch == 0 or stop_early:
+            tqdm.write(
                 f"  Epoch {epoch + 1:3d}/{args.epochs}: "
                 f"train_loss={train_loss:.4f}, train_acc={train_acc:.4f}, "
                 f"val_loss={val_loss:.4f}, val_acc={val_acc:.4f}"
             )
 
+        if stop_early:
+            tqdm.write(
+                f"  Early stopping: no loss improvement for "
+                f"{epochs_without_improvement} epochs"
+            )
+            break
+    progress.close()
+
     print(f"\n✅ Training complete!")
     print(f"  Best validation accuracy: {best_val_acc:.4f} (epoch {best_epoch})")
 
-    # Final evaluation
-    print(f"\n📊 Final evaluation...")
-    final_val_acc = 0.0
-    final_val_loss = float("inf")
-    train_acc = 0.0
-    train_loss = float("inf")
-    predictions = []
-
-    if len(val_loader) > 0:
-        final_val_loss, final_val_acc, predictions = evaluate(model, val_loader, device)
+    # Checkpoint and export the weights with the best monitored loss rather
+    # than those of the last epoch
+    if best_state is not None and best_loss_epoch != epochs_run:
+        print(f"  Restoring weights from epoch {best_loss_epoch}")
+        model.load_state_dict(best_state)
+        train_loss, train_acc = best_train_loss, best_train_acc
 
-    if len(train_loader) > 0:
-        train_loss, train_acc, _ = evaluate(model, train_loader, device)
+    # Final evaluation. Train metrics are the restored epoch's running
+    # averages rather than a second full pass over the training set.
+    print(f"\n📊 Final evaluation...")
+    final_val_loss, final_val_acc, predictions = evaluate(
+        model, val_batch, collect_predictions=True
+    )
+    # The best-accuracy epoch above need not be the one whose weights are
+    # saved, so report the saved model's own metrics too
+    print(
+        f"  Saved weights (epoch {best_loss_epoch}): "
+        f"val_loss={final_val_loss:.4f}, val_acc={final_val_acc:.4f}"
+    )
 
     # Compute dataset hash
-    with open(args.input, "rb") as f:
-        dataset_hash = hashlib.sha256(f.read()).hexdigest()
+    dataset_hash = hash_file(args.input)
 
     # Create output directory
     os.makedirs(args.output, exist_ok=True)
 
-    # Export ONNX
+    # Export ONNX: a dynamic-batch scoring graph plus one specialized for
+    # scoring a single item
     model_filename = f"{DEFAULT_MODEL_NAME}.onnx"
     model_path = os.path.join(args.output, model_filename)
+    single_item_filename = f"{DEFAULT_MODEL_NAME}_b1.onnx"
+    single_item_path = os.path.join(args.output, single_item_filename)
+
+    # Keep the full training state for resuming; the ONNX graphs below
+    # only contain the single-item scorer
+    checkpoint_filename = f"{DEFAULT_MODEL_NAME}.pt"
+    checkpoint_path = os.path.join(args.output, checkpoint_filename)
+    torch.save(
+        {
+            "modelState": model.state_dict(),
+            "modelConfig": {
+                "embeddingDim": args.embedding_dim,
+                "metricsDim": args.metrics_dim,
+                "hiddenDim": args.hidden_dim,
+            },
+            "featureScaling": (
+                {"mean": scaler.mean_.tolist(), "scale": scaler.scale_.tolist()}
+                if scaler is not None
+                else None
+            ),
+        },
+        checkpoint_path,
+    )
+
+    # Exported graphs take raw features, with normalization folded in
+    export_model = model
+    if scaler is not None:
+        export_model = fold_input_scaling(model, scaler.mean_, scaler.scale_)
 
     print(f"\n💾 Exporting model to: {model_path}")
-    export_onnx(model, args.embedding_dim, args.metrics_dim, model_path)
+    onnx_opset = export_onnx(
+        export_model, args.embedding_dim, args.metrics_dim, model_path
+    )
+    export_onnx(
+        export_model,
+        args.embedding_dim,
+        args.metrics_dim,
+        single_item_path,
+        dynamic=False,
+    )
 
     # Verify ONNX
     print("\n🔍 Verifying ONNX model...")
-    onnx_valid = verify_onnx(model_path, args.embedding_dim, args.metrics_dim)
+    onnx_valid = verify_onnx(
+        model_path, args.embedding_dim, args.metrics_dim
+    ) and verify_onnx(single_item_path, args.embedding_dim, args.metrics_dim)
+    if args.validate_onnx:
+        onnx_valid = (
+            check_onnx(model_path) and check_onnx(single_item_path) and onnx_valid
+        )
+
+    # Quantize weights to int8 for serving
+    print("\n🗜️  Quantizing ONNX model...")
+    quantized_filename = None
+    try:
+        quantized_path = quantize_onnx(model_path)
+    except Exception as e:
+        # The float models are already exported; record the failure in
+        # onnxValid instead of discarding the training run
+        print(f"  ONNX quantization failed: {e}", file=sys.stderr)
+        quantized_path = None
+        onnx_valid = False
+    if quantized_path:
+        if verify_onnx(quantized_path, args.embedding_dim, args.metrics_dim):
+            quantized_filename = os.path.basename(quantized_path)
+        else:
+            onnx_valid = False
 
     # Write metadata
     metadata = {
@@ -528,12 +1208,23 @@ def main():
         "embeddingDim": args.embedding_dim,
         "metricsDim": args.metrics_dim,
         "featureNames": dataset.feature_names,
+        "featureScaling": (
+            {
+                "mean": scaler.mean_.tolist(),
+                "scale": scaler.scale_.tolist(),
+                "foldedIntoModel": True,
+            }
+            if scaler is not None
+            else None
+        ),
         "datasetHash": dataset_hash,
         "trainMetrics": {
             "trainAccuracy": float(train_acc),
             "trainLoss": float(train_loss),
             "valAccuracy": float(final_val_acc),
             "valLoss": float(final_val_loss),
+            "epochsRun": epochs_run,
+            "bestEpoch": best_loss_epoch,
         },
         "modelConfig": {
             "hiddenDim": args.hidden_dim,
@@ -541,10 +1232,14 @@ def main():
             "margin": args.margin,
             "batchSize": args.batch_size,
             "epochs": args.epochs,
+            "patience": args.patience,
         },
         "createdAt": datetime.utcnow().isoformat() + "Z",
-        "onnxOpSet": 13,
+        "onnxOpSet": onnx_opset,
         "onnxValid": onnx_valid,
+        "singleItemModel": single_item_filename,
+        "quantizedModel": quantized_filename,
+        "checkpoint": checkpoint_filename,
     }
 
     metadata_filename = f"{DEFAULT_MODEL_NAME}_metadata.json"
@@ -568,6 +1263,10 @@ def main():
 
     print(f"\n📦 Model files created:")
     print(f"  - {model_path}")
+    print(f"  - {single_item_path}")
+    print(f"  - {checkpoint_path}")
+    if quantized_filename:
+        print(f"  - {quantized_path}")
     print(f"  - {metadata_path}")
     print(f"  - {active_path}")
 